@@ -1,10 +1,13 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from datetime import datetime, date, time
+from werkzeug.serving import is_running_from_reloader
+from datetime import datetime, date, time, timedelta
 import os
 from appointment_models import db, User, Doctor, Appointment
+from reminder_scheduler import ReminderScheduler, FileReminderSink
+from query_audit import QueryAuditor, query_budget
 
-def create_app():
+def create_app(config=None):
     """Create and configure the Flask application"""
     app = Flask(__name__)
     
@@ -19,12 +22,31 @@ def create_app():
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key')
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///appointments.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['REMINDERS_ENABLED'] = os.environ.get('REMINDERS_ENABLED', 'true').lower() == 'true'
+    app.config['REMINDER_LEAD_MINUTES'] = int(os.environ.get('REMINDER_LEAD_MINUTES', 60))
+    app.config['REMINDER_SINK_PATH'] = os.environ.get('REMINDER_SINK_PATH', 'reminders.jsonl')
+    app.config['REMINDER_STATE_PATH'] = os.environ.get('REMINDER_STATE_PATH', 'reminders_sent.jsonl')
+    app.config['QUERY_AUDIT'] = os.environ.get('QUERY_AUDIT', 'off').lower()  # off, log, raise
+    app.config['QUERY_AUDIT_REPEAT_THRESHOLD'] = int(os.environ.get('QUERY_AUDIT_REPEAT_THRESHOLD', 3))
+    
+    # Overrides passed in by callers (e.g. tests)
+    if config:
+        app.config.update(config)
     
     # Initialize extensions
     db.init_app(app)
+    QueryAuditor(app)
+    
+    # Reminder scheduler
+    app.extensions['reminder_scheduler'] = ReminderScheduler(
+        FileReminderSink(app.config['REMINDER_SINK_PATH']),
+        lead_time=timedelta(minutes=app.config['REMINDER_LEAD_MINUTES']),
+        state_path=app.config['REMINDER_STATE_PATH']
+    )
     
     # Authentication Routes
     @app.route('/api/auth/signin', methods=['POST'])
+    @query_budget(1)
     def signin():
         """User sign in"""
         try:
@@ -50,6 +72,7 @@ def create_app():
             return jsonify({'error': str(e)}), 500
     
     @app.route('/api/auth/signup', methods=['POST'])
+    @query_budget(3)
     def signup():
         """User sign up"""
         try:
@@ -90,6 +113,7 @@ def create_app():
     
     # Appointment Routes
     @app.route('/api/appointments', methods=['GET'])
+    @query_budget(2)
     def get_appointments():
         """Get appointments with optional filtering - FIXED VERSION"""
         try:
@@ -203,6 +227,7 @@ def create_app():
             return jsonify({'error': str(e)}), 500
     
     @app.route('/api/appointments', methods=['POST'])
+    @query_budget(4)
     def create_appointment():
         """Create a new appointment"""
         try:
@@ -244,6 +269,7 @@ def create_app():
             return jsonify({'error': str(e)}), 500
     
     @app.route('/api/appointments/<int:appointment_id>/status', methods=['PUT'])
+    @query_budget(5)
     def update_appointment_status(appointment_id):
         """Update appointment status"""
         try:
@@ -270,6 +296,7 @@ def create_app():
             return jsonify({'error': str(e)}), 500
     
     @app.route('/api/appointments/stats', methods=['GET'])
+    @query_budget(4)
     def get_appointment_stats():
         """Get appointment statistics"""
         try:
@@ -289,6 +316,7 @@ def create_app():
     
     # Doctor Routes
     @app.route('/api/doctors', methods=['GET'])
+    @query_budget(1)
     def get_doctors():
         """Get all active doctors"""
         try:
@@ -299,12 +327,14 @@ def create_app():
     
     # Health check
     @app.route('/api/health', methods=['GET'])
+    @query_budget(0)
     def health_check():
         """Health check endpoint"""
         return jsonify({'status': 'healthy', 'timestamp': datetime.utcnow().isoformat()}), 200
     
     # Root route
     @app.route('/')
+    @query_budget(0)
     def index():
         """Root endpoint with API information"""
         return jsonify({
@@ -337,6 +367,8 @@ def create_app():
         db.session.rollback()
         return jsonify({'error': 'Internal server error'}), 500
     
+    start_reminders(app)
+    
     return app
 
 def init_database(app):
@@ -393,7 +425,6 @@ def init_database(app):
             db.session.commit()
             
             # Add sample appointments
-            from datetime import timedelta
             today = date.today()
             
             appointments = [
@@ -428,8 +459,22 @@ def init_database(app):
         else:
             print(" Database already has data")
 
+def start_reminders(app):
+    """Start the in-process reminder scheduler if enabled"""
+    if not app.config['REMINDERS_ENABLED']:
+        print(" Reminder scheduler disabled")
+        return
+    scheduler = app.extensions['reminder_scheduler']
+    if app.debug and not is_running_from_reloader():
+        # This may be the debug reloader's parent, which only watches files and
+        # never serves requests, so wait until this process handles a request
+        app.before_request(lambda: scheduler.start(app))
+        print(" Reminder scheduler will start with the first request (debug mode)")
+        return
+    scheduler.start(app)
+
 if __name__ == '__main__':
-    app = create_app()
+    app = create_app({'DEBUG': True})
     init_database(app)
     print(" Starting EMR Appointment Service...")
     print(" API available at: http://localhost:5000/api")
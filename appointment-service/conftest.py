@@ -0,0 +1,26 @@
+import pytest
+
+from appointment_app import create_app, init_database
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Build apps backed by a fresh SQLite file with the sample data loaded"""
+    def make(**config):
+        settings = {
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+            'REMINDERS_ENABLED': False,
+            # Every request made in tests must stay within its query budget
+            'QUERY_AUDIT': 'raise'
+        }
+        settings.update(config)
+        app = create_app(settings)
+        init_database(app)
+        return app
+    return make
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
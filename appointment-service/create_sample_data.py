@@ -10,7 +10,7 @@ from datetime import datetime, date, time, timedelta
 
 def create_sample_data():
     """Create comprehensive sample data"""
-    app = create_app()
+    app = create_app({'REMINDERS_ENABLED': False})
     
     with app.app_context():
         print("🏥 Creating sample data for EMR Appointment System...")
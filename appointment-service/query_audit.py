@@ -0,0 +1,143 @@
+"""
+Opt-in query auditing for tests and staging.
+
+Every SQL statement run while handling a request is recorded through a
+SQLAlchemy engine event. When the request finishes the statements are
+grouped, repeated parameterized statements (N+1 patterns) are reported
+with the call site that issued them, and the route's declared query
+budget is enforced.
+
+Set QUERY_AUDIT to 'raise' (tests) or 'log' (staging); 'off' disables it.
+"""
+
+import functools
+import os
+import sys
+from collections import defaultdict
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+AUDIT_MODES = ('off', 'log', 'raise')
+
+_THIS_FILE = os.path.abspath(__file__)
+_SERVICE_DIR = os.path.dirname(_THIS_FILE)
+_engine_hooked = False
+
+
+class QueryAuditError(AssertionError):
+    """Raised in 'raise' mode when a request breaks its query audit"""
+
+
+def query_budget(max_queries):
+    """Declare the maximum number of SQL statements a view may run per request"""
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+@functools.lru_cache(maxsize=None)
+def _is_service_file(filename):
+    # Skip this module and code SQLAlchemy generates at runtime ('<...>')
+    if filename.startswith('<'):
+        return False
+    path = os.path.abspath(filename)
+    return path != _THIS_FILE and os.path.dirname(path) == _SERVICE_DIR
+
+
+def _call_site():
+    """Return 'file:line in function' for the innermost frame in this service"""
+    # Walk frames directly: this runs for every statement, so avoid building a full traceback
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        if _is_service_file(code.co_filename):
+            return f"{os.path.basename(code.co_filename)}:{frame.f_lineno} in {code.co_name}"
+        frame = frame.f_back
+    return 'unknown'
+
+
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context():
+        return
+    statements = g.get('audited_statements')
+    if statements is not None:
+        statements.append((statement, _call_site()))
+
+
+def _hook_engine():
+    global _engine_hooked
+    if not _engine_hooked:
+        event.listen(Engine, 'before_cursor_execute', _record_statement)
+        _engine_hooked = True
+
+
+def find_violations(statements, budget=None, repeat_threshold=3):
+    """Return a list of human-readable audit violations for one request"""
+    violations = []
+
+    if budget is not None and len(statements) > budget:
+        violations.append(f"ran {len(statements)} queries, budget is {budget}")
+
+    call_sites = defaultdict(list)
+    for statement, call_site in statements:
+        call_sites[statement].append(call_site)
+
+    for statement, sites in call_sites.items():
+        if len(sites) >= repeat_threshold:
+            unique_sites = ', '.join(sorted(set(sites)))
+            summary = ' '.join(statement.split())[:200]
+            violations.append(
+                f"possible N+1: statement ran {len(sites)} times from {unique_sites}: {summary}"
+            )
+
+    return violations
+
+
+class QueryAuditor:
+    """Flask extension that audits the queries run by each request"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('QUERY_AUDIT', 'off')
+        app.config.setdefault('QUERY_AUDIT_REPEAT_THRESHOLD', 3)
+
+        mode = app.config['QUERY_AUDIT']
+        if mode not in AUDIT_MODES:
+            raise ValueError(f"QUERY_AUDIT must be one of {', '.join(AUDIT_MODES)}, got '{mode}'")
+        app.extensions['query_auditor'] = self
+        if mode == 'off':
+            return
+
+        _hook_engine()
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def _start_request(self):
+        g.audited_statements = []
+
+    def _finish_request(self, response):
+        statements = g.pop('audited_statements', None)
+        if statements is None:
+            return response
+
+        view = current_app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', None)
+        violations = find_violations(
+            statements,
+            budget=budget,
+            repeat_threshold=current_app.config['QUERY_AUDIT_REPEAT_THRESHOLD']
+        )
+        if not violations:
+            return response
+
+        message = f"Query audit failed for {request.method} {request.path}:\n  " + '\n  '.join(violations)
+        if current_app.config['QUERY_AUDIT'] == 'raise':
+            raise QueryAuditError(message)
+        current_app.logger.warning(message)
+        return response
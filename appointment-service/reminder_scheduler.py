@@ -0,0 +1,410 @@
+"""
+In-process reminder scheduler for upcoming appointments.
+
+Upcoming appointments are loaded from the database once at startup and
+kept in a min-heap ordered by reminder time. After that the heap is kept
+current from SQLAlchemy ORM events, so the database is never polled.
+Due reminders are handed to a sink in batches from a background thread.
+Sent reminders are recorded in an optional state file so a restart does
+not send them again. A lock file next to it makes sure only one process
+dispatches reminders.
+"""
+
+import heapq
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.orm import Session, object_session
+
+from appointment_models import Appointment
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process ownership lock
+    fcntl = None
+
+# Statuses that still need a reminder; anything else drops the appointment
+ACTIVE_STATUSES = ('Scheduled', 'Confirmed', 'Upcoming')
+
+
+def _sent_key(reminder):
+    return (reminder['appointmentId'], reminder['startsAt'])
+
+
+class FileReminderSink:
+    """Append each reminder as one JSON line to a local file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, batch):
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as fh:
+                for reminder in batch:
+                    fh.write(json.dumps(reminder) + '\n')
+
+
+class QueueReminderSink:
+    """Put each batch of reminders on an in-memory queue"""
+
+    def __init__(self, maxsize=0):
+        self.queue = queue.Queue(maxsize=maxsize)
+
+    def send(self, batch):
+        self.queue.put(batch)
+
+
+class ReminderScheduler:
+    """Fire reminder jobs for upcoming appointments from a min-heap of timers"""
+
+    def __init__(self, sink, lead_time=timedelta(minutes=60), batch_size=100, clock=datetime.now,
+                 state_path=None, retry_delay=timedelta(seconds=30), max_retry_delay=timedelta(minutes=30)):
+        self.sink = sink
+        self.lead_time = lead_time
+        self.batch_size = batch_size
+        self.clock = clock
+        self.state_path = state_path
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.logger = logging.getLogger(__name__)
+
+        self._heap = []       # (remind_at, appointment_id, version)
+        self._entries = {}    # appointment_id -> (version, reminder payload)
+        self._version = 0
+        self._sent = set()    # (appointment_id, startsAt) of reminders already sent
+        self._attempts = {}   # appointment_id -> failed sends so far
+        self._cond = threading.Condition()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._lock_file = None
+        self._standby = False   # another process owns reminder dispatch
+        self._stopped = False
+        self._listening = False
+        # Each scheduler stages its own changes so several can share a Session class
+        self._pending_key = ('pending_reminders', id(self))
+
+    # Heap maintenance
+
+    def schedule(self, reminder):
+        """Add or replace the reminder for one appointment"""
+        remind_at = datetime.fromisoformat(reminder['remindAt'])
+        with self._cond:
+            if _sent_key(reminder) in self._sent:
+                return
+            self._attempts.pop(reminder['appointmentId'], None)
+            self._push(reminder, remind_at)
+
+    def _push(self, reminder, remind_at):
+        # Callers hold self._cond
+        self._version += 1
+        self._entries[reminder['appointmentId']] = (self._version, reminder)
+        heapq.heappush(self._heap, (remind_at, reminder['appointmentId'], self._version))
+        # Wake the worker in case this is now the earliest timer
+        self._cond.notify()
+
+    def cancel(self, appointment_id):
+        """Drop the reminder for an appointment; its heap entry is skipped lazily"""
+        with self._cond:
+            self._entries.pop(appointment_id, None)
+            self._attempts.pop(appointment_id, None)
+
+    def pending_count(self):
+        with self._cond:
+            return len(self._entries)
+
+    def _reminder_for(self, appointment):
+        """Build the reminder payload, or None if no reminder is needed"""
+        if appointment.status not in ACTIVE_STATUSES:
+            return None
+        starts_at = datetime.combine(appointment.date, appointment.time)
+        if starts_at <= self.clock():
+            return None
+        return {
+            'appointmentId': appointment.id,
+            'patientId': appointment.patient_id,
+            'doctorId': appointment.doctor_id,
+            'date': appointment.date.strftime('%Y-%m-%d'),
+            'time': appointment.time.strftime('%H:%M'),
+            'mode': appointment.mode,
+            'startsAt': starts_at.isoformat(),
+            'remindAt': (starts_at - self.lead_time).isoformat()
+        }
+
+    def _apply(self, appointment_id, reminder):
+        if reminder is None:
+            self.cancel(appointment_id)
+        else:
+            self.schedule(reminder)
+
+    def _load_sent(self):
+        """Read the state file, dropping reminders for appointments already started"""
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        now = self.clock()
+        kept = []
+        with open(self.state_path, encoding='utf-8') as fh:
+            for line_number, line in enumerate(fh, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    starts_at = datetime.fromisoformat(record['startsAt'])
+                    _sent_key(record)
+                except (ValueError, KeyError, TypeError) as e:
+                    # e.g. a line cut short when the process was killed mid-append
+                    self.logger.warning(f"Skipping malformed line {line_number} in {self.state_path}: {e}")
+                    continue
+                if starts_at > now:
+                    kept.append(record)
+        # Write the pruned history next to the live file and swap it in atomically
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as fh:
+            for record in kept:
+                fh.write(json.dumps(record) + '\n')
+        os.replace(tmp_path, self.state_path)
+        with self._cond:
+            self._sent.update(_sent_key(record) for record in kept)
+
+    def _record_sent(self, batch):
+        with self._cond:
+            self._sent.update(_sent_key(reminder) for reminder in batch)
+        if not self.state_path:
+            return
+        try:
+            with open(self.state_path, 'a', encoding='utf-8') as fh:
+                for reminder in batch:
+                    record = {'appointmentId': reminder['appointmentId'], 'startsAt': reminder['startsAt']}
+                    fh.write(json.dumps(record) + '\n')
+        except OSError as e:
+            # Still recorded in memory, so only a restart could resend these
+            appointment_ids = [reminder['appointmentId'] for reminder in batch]
+            self.logger.error(f"Could not record sent reminders for appointments {appointment_ids} "
+                              f"in {self.state_path}: {e}")
+
+    def load(self):
+        """Load upcoming appointments once; requires an application context"""
+        self._load_sent()
+        today = self.clock().date()
+        try:
+            appointments = Appointment.query.filter(
+                Appointment.date >= today,
+                Appointment.status.in_(ACTIVE_STATUSES)
+            ).all()
+        except (OperationalError, ProgrammingError) as e:
+            # Schema not created yet (see init_database); new appointments still arrive via ORM events
+            Appointment.query.session.rollback()
+            self.logger.warning(f"Could not load upcoming appointments, starting with none: {e}")
+            return len(self._entries)
+        for appointment in appointments:
+            reminder = self._reminder_for(appointment)
+            if reminder is not None:
+                self.schedule(reminder)
+        return len(self._entries)
+
+    # ORM events
+
+    def _track(self, mapper, connection, target):
+        # Changes are staged on the session and applied only after commit
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault(self._pending_key, {})[target.id] = self._reminder_for(target)
+
+    def _track_delete(self, mapper, connection, target):
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault(self._pending_key, {})[target.id] = None
+
+    def _on_commit(self, session):
+        for appointment_id, reminder in session.info.pop(self._pending_key, {}).items():
+            self._apply(appointment_id, reminder)
+
+    def _on_rollback(self, session):
+        session.info.pop(self._pending_key, None)
+
+    def _listeners(self):
+        return [
+            (Appointment, 'after_insert', self._track),
+            (Appointment, 'after_update', self._track),
+            (Appointment, 'after_delete', self._track_delete),
+            (Session, 'after_commit', self._on_commit),
+            (Session, 'after_rollback', self._on_rollback)
+        ]
+
+    def listen(self):
+        """Keep the heap current from Appointment inserts, updates and deletes"""
+        if self._listening:
+            return
+        for target, name, fn in self._listeners():
+            event.listen(target, name, fn)
+        self._listening = True
+
+    def unlisten(self):
+        """Stop receiving Appointment changes"""
+        if not self._listening:
+            return
+        for target, name, fn in self._listeners():
+            event.remove(target, name, fn)
+        self._listening = False
+
+    # Dispatch
+
+    def _pop_due(self, now):
+        """Pop up to batch_size due reminders, skipping cancelled or replaced entries"""
+        batch = []
+        while self._heap and len(batch) < self.batch_size:
+            remind_at, appointment_id, version = self._heap[0]
+            entry = self._entries.get(appointment_id)
+            if entry is None or entry[0] != version:
+                heapq.heappop(self._heap)
+                continue
+            if remind_at > now:
+                break
+            heapq.heappop(self._heap)
+            del self._entries[appointment_id]
+            batch.append(entry[1])
+        return batch
+
+    def _next_timeout(self, now):
+        if not self._heap:
+            return None
+        return max((self._heap[0][0] - now).total_seconds(), 0)
+
+    def dispatch_due(self):
+        """Send every reminder that is due now; returns the number sent"""
+        sent = 0
+        while True:
+            with self._cond:
+                batch = self._pop_due(self.clock())
+            if not batch:
+                return sent
+            if self._send(batch):
+                sent += len(batch)
+
+    def _send(self, batch):
+        """Hand a batch to the sink; on failure put it back with a backoff"""
+        appointment_ids = [reminder['appointmentId'] for reminder in batch]
+        try:
+            self.sink.send(batch)
+        except Exception as e:
+            self.logger.error(f"Reminder sink failed for appointments {appointment_ids}: {e}; will retry")
+            self._retry(batch)
+            return False
+        with self._cond:
+            for appointment_id in appointment_ids:
+                self._attempts.pop(appointment_id, None)
+        self._record_sent(batch)
+        return True
+
+    def _retry(self, batch):
+        now = self.clock()
+        with self._cond:
+            for reminder in batch:
+                appointment_id = reminder['appointmentId']
+                # Rescheduled while the batch was being sent; the newer reminder wins
+                if appointment_id in self._entries:
+                    continue
+                if datetime.fromisoformat(reminder['startsAt']) <= now:
+                    self.logger.error(f"Dropping reminder for appointment {appointment_id}: it has already started")
+                    self._attempts.pop(appointment_id, None)
+                    continue
+                attempts = self._attempts.get(appointment_id, 0) + 1
+                self._attempts[appointment_id] = attempts
+                delay = min(self.retry_delay * 2 ** (attempts - 1), self.max_retry_delay)
+                self._push(reminder, now + delay)
+
+    def _wait_for_batch(self):
+        """Block until reminders are due; returns None once stopped"""
+        with self._cond:
+            while not self._stopped:
+                now = self.clock()
+                batch = self._pop_due(now)
+                if batch:
+                    return batch
+                self._cond.wait(self._next_timeout(now))
+            return None
+
+    def _run(self):
+        while True:
+            try:
+                batch = self._wait_for_batch()
+                if batch is None:
+                    return
+                self._send(batch)
+            except Exception:
+                # Never let one failure end the thread; back off briefly and carry on
+                self.logger.exception("Reminder scheduler iteration failed")
+                with self._cond:
+                    if not self._stopped:
+                        self._cond.wait(1)
+
+    def _load_and_run(self, app):
+        # Loading here keeps the startup queries out of any request that triggered start()
+        try:
+            with app.app_context():
+                count = self.load()
+            print(f" Reminder scheduler started with {count} pending reminders")
+        except Exception:
+            self.logger.exception("Reminder scheduler could not load upcoming appointments")
+        self._run()
+
+    def _acquire_ownership(self):
+        """Take a non-blocking lock next to the state file; False if another process holds it"""
+        if not self.state_path or fcntl is None:
+            return True
+        lock_path = f"{self.state_path}.lock"
+        try:
+            lock_file = open(lock_path, 'a')
+        except OSError as e:
+            self.logger.error(f"Could not open reminder lock file {lock_path}: {e}; dispatching without it")
+            return True
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _release_ownership(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def start(self, app):
+        """Start the background thread that loads and dispatches reminders; safe to call repeatedly"""
+        if self._thread is not None or self._standby:
+            return
+        with self._start_lock:
+            if self._thread is not None or self._standby:
+                return
+            self.logger = app.logger
+            if not self._acquire_ownership():
+                self._standby = True
+                self.logger.warning(
+                    f"Another process holds {self.state_path}.lock and dispatches reminders; "
+                    "appointment changes made in this process will not reach it until it restarts"
+                )
+                return
+            # Listen first so changes committed while loading are not missed
+            self.listen()
+            self._stopped = False
+            self._thread = threading.Thread(target=self._load_and_run, args=(app,),
+                                            name='reminder-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self.unlisten()
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._release_ownership()
@@ -0,0 +1,102 @@
+import logging
+
+import pytest
+import sqlalchemy.orm
+
+from appointment_app import create_app
+from query_audit import QueryAuditError, _call_site, find_violations
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.mark.parametrize('method, url, body, status', [
+    ('post', '/api/auth/signin', {'email': 'admin@emr.com', 'password': 'password'}, 200),
+    ('post', '/api/auth/signup', {'fullName': 'New Patient', 'email': 'new@email.com',
+                                  'phoneNumber': '+1-555-0199', 'age': 30, 'password': 'secret'}, 201),
+    ('get', '/api/appointments', None, 200),
+    ('get', '/api/appointments?status=upcoming', None, 200),
+    ('post', '/api/appointments', {'patientId': 2, 'doctorId': 1, 'date': '2030-01-01',
+                                   'time': '10:00', 'reason': 'Checkup'}, 201),
+    ('put', '/api/appointments/1/status', {'status': 'Completed'}, 200),
+    ('get', '/api/appointments/stats', None, 200),
+    ('get', '/api/doctors', None, 200),
+    ('get', '/api/health', None, 200),
+    ('get', '/', None, 200),
+])
+def test_routes_stay_within_query_budget(client, method, url, body, status):
+    response = getattr(client, method)(url, json=body)
+    assert response.status_code == status
+
+
+def broken_joinedload(*args, **kwargs):
+    raise RuntimeError('joinedload unavailable')
+
+
+def test_lazy_loading_fallback_is_reported(client, monkeypatch):
+    # get_appointments falls back to a plain query, lazy loading patient and doctor per row
+    monkeypatch.setattr(sqlalchemy.orm, 'joinedload', broken_joinedload)
+
+    with pytest.raises(QueryAuditError) as excinfo:
+        client.get('/api/appointments')
+
+    message = str(excinfo.value)
+    assert 'budget is 2' in message
+    assert 'possible N+1' in message
+    assert 'appointment_app.py' in message
+
+
+def test_log_mode_logs_instead_of_raising(make_app, monkeypatch, caplog):
+    monkeypatch.setattr(sqlalchemy.orm, 'joinedload', broken_joinedload)
+    client = make_app(QUERY_AUDIT='log').test_client()
+
+    with caplog.at_level(logging.WARNING):
+        response = client.get('/api/appointments')
+
+    assert response.status_code == 200
+    assert 'Query audit failed for GET /api/appointments' in caplog.text
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        create_app({'QUERY_AUDIT': 'loud', 'REMINDERS_ENABLED': False})
+
+
+def test_no_violations_within_budget():
+    statements = [('SELECT 1', 'a.py:1'), ('SELECT 2', 'a.py:2')]
+    assert find_violations(statements, budget=2) == []
+
+
+def test_budget_overrun_is_reported():
+    statements = [('SELECT 1', 'a.py:1'), ('SELECT 2', 'a.py:2')]
+    assert find_violations(statements, budget=1) == ['ran 2 queries, budget is 1']
+
+
+def test_routes_without_budget_only_check_repeats():
+    statements = [(f'SELECT {i}', 'a.py:1') for i in range(50)]
+    assert find_violations(statements) == []
+
+
+def test_repeated_statement_is_reported_with_call_sites():
+    statement = 'SELECT users.id\n  FROM users WHERE users.id = ?'
+    statements = [(statement, 'models.py:10'), (statement, 'models.py:10'), (statement, 'app.py:5')]
+
+    [violation] = find_violations(statements)
+    assert violation.startswith('possible N+1: statement ran 3 times from app.py:5, models.py:10')
+    assert violation.endswith('SELECT users.id FROM users WHERE users.id = ?')
+
+
+def test_repeats_below_threshold_are_allowed():
+    statements = [('SELECT 1', 'a.py:1')] * 2
+    assert find_violations(statements, repeat_threshold=3) == []
+    assert len(find_violations(statements, repeat_threshold=2)) == 1
+
+
+def test_call_site_is_the_innermost_service_frame():
+    def lookup():
+        return _call_site()
+
+    assert lookup().startswith('test_query_audit.py:')
+    assert lookup().endswith(' in lookup')
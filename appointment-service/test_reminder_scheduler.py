@@ -0,0 +1,341 @@
+import json
+from datetime import date, datetime, time, timedelta
+
+import pytest
+
+from appointment_app import create_app
+from appointment_models import db, Appointment
+from reminder_scheduler import ReminderScheduler, QueueReminderSink
+
+START = datetime(2030, 1, 1, 8, 0)
+
+
+class FakeClock:
+    def __init__(self, now=START):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, **kwargs):
+        self.now += timedelta(**kwargs)
+
+
+class FailingSink(QueueReminderSink):
+    def __init__(self):
+        super().__init__()
+        self.failing = True
+
+    def send(self, batch):
+        if self.failing:
+            raise IOError('sink unavailable')
+        super().send(batch)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def make_scheduler(clock):
+    schedulers = []
+
+    def make(sink=None, **kwargs):
+        kwargs.setdefault('lead_time', timedelta(minutes=60))
+        scheduler = ReminderScheduler(sink or QueueReminderSink(), clock=clock, **kwargs)
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield make
+    for scheduler in schedulers:
+        scheduler.stop(timeout=1)
+
+
+def reminder(appointment_id, starts_at, lead=timedelta(minutes=60)):
+    return {
+        'appointmentId': appointment_id,
+        'startsAt': starts_at.isoformat(),
+        'remindAt': (starts_at - lead).isoformat()
+    }
+
+
+def drain(sink):
+    batches = []
+    while not sink.queue.empty():
+        batches.append(sink.queue.get_nowait())
+    return batches
+
+
+def sent_ids(sink):
+    return [r['appointmentId'] for batch in drain(sink) for r in batch]
+
+
+def add_appointment(hour=10, status='Scheduled'):
+    appointment = Appointment(
+        patient_id=2, doctor_id=1, date=date(2030, 1, 1), time=time(hour, 0),
+        reason='Checkup', status=status
+    )
+    db.session.add(appointment)
+    return appointment
+
+
+def test_reminders_are_sent_in_time_order(make_scheduler, clock):
+    scheduler = make_scheduler()
+    scheduler.schedule(reminder(1, START + timedelta(hours=3)))
+    scheduler.schedule(reminder(2, START + timedelta(hours=2)))
+    scheduler.schedule(reminder(3, START + timedelta(hours=4)))
+
+    clock.advance(hours=3)
+    assert scheduler.dispatch_due() == 3
+    assert sent_ids(scheduler.sink) == [2, 1, 3]
+
+
+def test_only_due_reminders_are_sent(make_scheduler, clock):
+    scheduler = make_scheduler()
+    scheduler.schedule(reminder(1, START + timedelta(minutes=30)))
+    scheduler.schedule(reminder(2, START + timedelta(hours=5)))
+
+    assert scheduler.dispatch_due() == 1
+    assert sent_ids(scheduler.sink) == [1]
+    assert scheduler.pending_count() == 1
+
+
+def test_cancelled_reminder_is_skipped(make_scheduler, clock):
+    scheduler = make_scheduler()
+    scheduler.schedule(reminder(1, START + timedelta(minutes=30)))
+    scheduler.cancel(1)
+
+    assert scheduler.dispatch_due() == 0
+    assert scheduler._heap == []
+
+
+def test_rescheduled_reminder_replaces_the_old_one(make_scheduler, clock):
+    scheduler = make_scheduler()
+    scheduler.schedule(reminder(1, START + timedelta(minutes=30)))
+    scheduler.schedule(reminder(1, START + timedelta(hours=3)))
+
+    assert scheduler.dispatch_due() == 0
+    clock.advance(hours=2)
+    assert scheduler.dispatch_due() == 1
+    [[sent]] = drain(scheduler.sink)
+    assert sent['startsAt'] == (START + timedelta(hours=3)).isoformat()
+
+
+def test_due_reminders_are_split_into_batches(make_scheduler, clock):
+    scheduler = make_scheduler(batch_size=2)
+    for appointment_id in range(5):
+        scheduler.schedule(reminder(appointment_id, START + timedelta(minutes=30)))
+
+    assert scheduler.dispatch_due() == 5
+    assert [len(batch) for batch in drain(scheduler.sink)] == [2, 2, 1]
+
+
+def test_committed_changes_update_the_heap(app, make_scheduler):
+    scheduler = make_scheduler()
+    scheduler.listen()
+    with app.app_context():
+        appointment = add_appointment()
+        db.session.commit()
+        assert scheduler.pending_count() == 1
+
+        appointment.status = 'Cancelled'
+        db.session.commit()
+        assert scheduler.pending_count() == 0
+
+
+def test_rolled_back_changes_are_discarded(app, make_scheduler):
+    scheduler = make_scheduler()
+    scheduler.listen()
+    with app.app_context():
+        add_appointment()
+        db.session.flush()
+        db.session.rollback()
+        assert scheduler.pending_count() == 0
+
+        add_appointment()
+        db.session.commit()
+        assert scheduler.pending_count() == 1
+
+
+def test_stopped_scheduler_no_longer_receives_changes(app, make_scheduler):
+    old = make_scheduler()
+    old.listen()
+    old.stop()
+    new = make_scheduler()
+    new.listen()
+    with app.app_context():
+        add_appointment()
+        db.session.commit()
+
+    assert old.pending_count() == 0
+    assert new.pending_count() == 1
+
+
+def test_schedulers_stage_changes_independently(app, make_scheduler):
+    first = make_scheduler()
+    second = make_scheduler()
+    first.listen()
+    second.listen()
+    with app.app_context():
+        add_appointment()
+        db.session.commit()
+
+    assert first.pending_count() == 1
+    assert second.pending_count() == 1
+
+
+def test_restart_does_not_resend_reminders(app, make_scheduler, clock, tmp_path):
+    state_path = str(tmp_path / 'sent.jsonl')
+    with app.app_context():
+        add_appointment(hour=9)
+        add_appointment(hour=12)
+        db.session.commit()
+
+        first = make_scheduler(state_path=state_path)
+        assert first.load() == 2
+        assert first.dispatch_due() == 1
+
+        restarted = make_scheduler(state_path=state_path)
+        assert restarted.load() == 1
+        assert restarted.dispatch_due() == 0
+
+
+def test_load_without_tables_starts_empty(make_scheduler, tmp_path, caplog):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'empty.db'}",
+        'REMINDERS_ENABLED': False
+    })
+    scheduler = make_scheduler()
+    with app.app_context():
+        assert scheduler.load() == 0
+        assert not db.inspect(db.engine).has_table('appointments')
+    assert 'Could not load upcoming appointments' in caplog.text
+
+
+def test_failed_batch_is_retried_with_backoff(make_scheduler, clock):
+    sink = FailingSink()
+    scheduler = make_scheduler(sink, retry_delay=timedelta(seconds=30))
+    scheduler.schedule(reminder(1, START + timedelta(minutes=30)))
+
+    assert scheduler.dispatch_due() == 0
+    assert scheduler.pending_count() == 1
+
+    clock.advance(seconds=30)
+    assert scheduler.dispatch_due() == 0
+    clock.advance(seconds=30)
+    assert scheduler.dispatch_due() == 0, 'second retry waits twice as long'
+
+    sink.failing = False
+    clock.advance(seconds=30)
+    assert scheduler.dispatch_due() == 1
+    assert sent_ids(sink) == [1]
+
+
+def test_malformed_state_lines_are_skipped(make_scheduler, clock, tmp_path, caplog):
+    state_file = tmp_path / 'sent.jsonl'
+    starts_at = (START + timedelta(minutes=30)).isoformat()
+    state_file.write_text(
+        json.dumps({'appointmentId': 1, 'startsAt': starts_at}) + '\n'
+        + '{"appointmentId": 2, "star'
+    )
+    scheduler = make_scheduler(state_path=str(state_file))
+    scheduler._load_sent()
+
+    assert 'Skipping malformed line 2' in caplog.text
+    assert scheduler._sent == {(1, starts_at)}
+    # The rewritten file only keeps the valid record
+    assert state_file.read_text() == json.dumps({'appointmentId': 1, 'startsAt': starts_at}) + '\n'
+
+
+def test_failed_state_write_is_logged(make_scheduler, clock, tmp_path, caplog):
+    state_path = str(tmp_path / 'missing_dir' / 'sent.jsonl')
+    scheduler = make_scheduler(state_path=state_path)
+    scheduler.schedule(reminder(1, START + timedelta(minutes=30)))
+
+    assert scheduler.dispatch_due() == 1
+    assert 'Could not record sent reminders for appointments [1]' in caplog.text
+
+    # Still remembered in memory, so it is not sent twice
+    scheduler.schedule(reminder(1, START + timedelta(minutes=30)))
+    assert scheduler.pending_count() == 0
+
+
+def test_background_thread_survives_failed_state_write(app, tmp_path):
+    sink = QueueReminderSink()
+    scheduler = ReminderScheduler(sink, batch_size=1, state_path=str(tmp_path / 'missing_dir' / 'sent.jsonl'))
+    due = datetime.now() + timedelta(minutes=30)
+    try:
+        scheduler.start(app)
+        scheduler.schedule(reminder(101, due))
+        scheduler.schedule(reminder(102, due))
+
+        sent = []
+        while not {101, 102} <= set(sent):
+            sent.extend(r['appointmentId'] for r in sink.queue.get(timeout=5))
+        assert scheduler._thread.is_alive()
+    finally:
+        scheduler.stop(timeout=1)
+
+
+@pytest.mark.parametrize('debug, started_at_boot', [(False, True), (True, False)])
+def test_app_factory_starts_the_scheduler(make_app, tmp_path, monkeypatch, debug, started_at_boot):
+    monkeypatch.delenv('WERKZEUG_RUN_MAIN', raising=False)
+    app = make_app(
+        DEBUG=debug,
+        REMINDERS_ENABLED=True,
+        REMINDER_SINK_PATH=str(tmp_path / 'reminders.jsonl'),
+        REMINDER_STATE_PATH=str(tmp_path / 'sent.jsonl')
+    )
+    scheduler = app.extensions['reminder_scheduler']
+    try:
+        assert (scheduler._thread is not None) == started_at_boot
+        # In debug mode this could be the reloader's parent, so it waits for a request
+        app.test_client().get('/api/health')
+        assert scheduler._thread.is_alive()
+    finally:
+        scheduler.stop(timeout=1)
+
+
+def test_only_one_scheduler_owns_dispatch(app, tmp_path):
+    state_path = str(tmp_path / 'sent.jsonl')
+    owner = ReminderScheduler(QueueReminderSink(), state_path=state_path)
+    other = ReminderScheduler(QueueReminderSink(), state_path=state_path)
+    replacement = ReminderScheduler(QueueReminderSink(), state_path=state_path)
+    try:
+        owner.start(app)
+        other.start(app)
+        assert owner._thread.is_alive()
+        assert other._thread is None
+        assert not other._listening
+
+        # Once the owner stops, the lock is free for a new process
+        owner.stop(timeout=1)
+        replacement.start(app)
+        assert replacement._thread.is_alive()
+    finally:
+        for scheduler in (owner, other, replacement):
+            scheduler.stop(timeout=1)
+
+
+def test_started_scheduler_dispatches_in_the_background(app):
+    sink = QueueReminderSink()
+    scheduler = ReminderScheduler(sink, lead_time=timedelta(days=365))
+    try:
+        scheduler.start(app)
+        with app.app_context():
+            appointment = Appointment(
+                patient_id=2, doctor_id=1, date=date.today() + timedelta(days=1),
+                time=time(9, 0), reason='Checkup'
+            )
+            db.session.add(appointment)
+            db.session.commit()
+            appointment_id = appointment.id
+
+        # The sample appointments are due too and may arrive in an earlier batch
+        sent = []
+        while appointment_id not in sent:
+            sent.extend(r['appointmentId'] for r in sink.queue.get(timeout=5))
+    finally:
+        scheduler.stop(timeout=1)